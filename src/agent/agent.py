@@ -1,11 +1,27 @@
-from langchain_core.messages import SystemMessage
+from functools import cache
+from typing import Annotated, Any, TypedDict
+
+from langchain_community.cache import SQLiteCache
+from langchain_core.globals import set_llm_cache
+from langchain_core.language_models import LanguageModelInput
+from langchain_core.messages import (
+    BaseMessage,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    get_buffer_string,
+)
+from langchain_core.runnables import Runnable
 from langchain_ollama import ChatOllama
 from langgraph.checkpoint.memory import MemorySaver
-from langgraph.graph import END, MessagesState, StateGraph
+from langgraph.graph import END, StateGraph, add_messages
+from langgraph.graph.state import CompiledStateGraph
 from langgraph.prebuilt import ToolNode
 
 from agent.tools import AGENT_TOOLS
 
+__all__ = ["AgentState", "get_agent"]
+
 SYSTEM_PROMPT = """
 # Role
 You are an expert Python developer acting as an automated code-quality assistant.
@@ -49,23 +65,114 @@ You analyse, lint, format, refactor, and test Python code the user provides.
 - When the user supplies no code, ask for it before calling any tool.
 """
 
-_llm = ChatOllama(model="llama3.1", temperature=0.5).bind_tools(AGENT_TOOLS)
+
+class AgentState(TypedDict):
+    # add_messages appends each node's new messages to the history (and
+    # replaces by id) instead of overwriting the list.
+    messages: Annotated[list[BaseMessage], add_messages]
+    # Older turns folded out of `messages` by the summarize node.
+    summary: str
+
+
+# Built once and always sent first, byte-identical, so Ollama can reuse the KV
+# cache for this prefix instead of re-prefilling it every turn.  Keep dynamic
+# content (timestamps, session ids, ...) out of the system prompt.
+_SYSTEM_MESSAGE = SystemMessage(SYSTEM_PROMPT)
+
+# Once the history grows past _MAX_HISTORY_MESSAGES, everything before the
+# last _KEEP_RECENT_MESSAGES or so is folded into the summary.  The summary sits
+# right after the system prompt and only changes when a fold happens, so the
+# cached prefix survives every tool round in between.
+_MAX_HISTORY_MESSAGES = 24
+_KEEP_RECENT_MESSAGES = 8
+
+_SUMMARY_PROMPT = (
+    "Summarize the conversation below between a user and a Python code-quality "
+    "assistant. Keep the code under discussion, the user's goals, tool results "
+    "that still matter, and any decisions made. Be concise.\n\n"
+    "{previous}{transcript}"
+)
+
+
+@cache
+def _get_llm() -> Runnable[LanguageModelInput, BaseMessage]:
+    # keep_alive holds the model, and with it the cached prefix, in memory
+    # between turns; num_ctx leaves room for the prompt plus the history.
+    return ChatOllama(
+        model="llama3.1", temperature=0.5, keep_alive="30m", num_ctx=8192
+    ).bind_tools(AGENT_TOOLS)
 
 
-def _orchestrator(state: MessagesState) -> dict:
-    messages = [SystemMessage(SYSTEM_PROMPT)] + state["messages"]
-    return {"messages": [_llm.invoke(messages)]}
+@cache
+def _get_summary_llm() -> ChatOllama:
+    # Same model and num_ctx as the orchestrator so Ollama does not reload it.
+    return ChatOllama(model="llama3.1", temperature=0, keep_alive="30m", num_ctx=8192)
 
 
-def _should_continue(state: MessagesState) -> str:
+def _fold_point(messages: list[BaseMessage]) -> int:
+    """Return how many leading messages to fold into the summary."""
+    if len(messages) <= _MAX_HISTORY_MESSAGES:
+        return 0
+    # Cut just before a user turn so no tool call is split from its result.
+    for index in range(len(messages) - _KEEP_RECENT_MESSAGES, 0, -1):
+        if isinstance(messages[index], HumanMessage):
+            return index
+    return 0
+
+
+async def _summarize(state: AgentState) -> dict[str, Any]:
+    messages = state["messages"]
+    cut = _fold_point(messages)
+    if not cut:
+        return {}
+
+    previous = state.get("summary", "")
+    prompt = _SUMMARY_PROMPT.format(
+        previous=f"Earlier summary:\n{previous}\n\n" if previous else "",
+        transcript=get_buffer_string(messages[:cut]),
+    )
+    summary = await _get_summary_llm().ainvoke([HumanMessage(prompt)])
+    return {
+        "summary": summary.text,
+        "messages": [RemoveMessage(id=m.id) for m in messages[:cut] if m.id],
+    }
+
+
+async def _orchestrator(state: AgentState) -> dict[str, Any]:
+    messages: list[BaseMessage] = [_SYSTEM_MESSAGE]
+    if summary := state.get("summary"):
+        messages.append(
+            SystemMessage(f"Summary of the conversation so far:\n{summary}")
+        )
+    # New messages, tool results included, are only ever appended, so
+    # everything before them is an unchanged prefix from the previous call.
+    messages += state["messages"]
+    # ainvoke() rather than astream(): only invoke consults the LLM cache, and
+    # under stream_mode="messages" LangGraph's callback still makes it stream
+    # tokens from Ollama as they are generated.
+    return {"messages": [await _get_llm().ainvoke(messages)]}
+
+
+def _should_continue(state: AgentState) -> str:
     return "tools" if state["messages"][-1].tool_calls else END
 
 
-_graph = StateGraph(MessagesState)
-_graph.add_node("orchestrator", _orchestrator)
-_graph.add_node("tools", ToolNode(AGENT_TOOLS))
-_graph.set_entry_point("orchestrator")
-_graph.add_conditional_edges("orchestrator", _should_continue)
-_graph.add_edge("tools", "orchestrator")
+@cache
+def get_agent() -> CompiledStateGraph[AgentState]:
+    """Build the agent graph on first call and return the shared instance."""
+    # Exact-prompt cache shared by every chat model in the process (the
+    # orchestrator and the refactor LLM), so repeated prompts skip Ollama.
+    set_llm_cache(SQLiteCache(database_path=".devtools_llm_cache.db"))
+
+    graph = StateGraph(AgentState)
+    graph.add_node("summarize", _summarize)
+    graph.add_node("orchestrator", _orchestrator)
+    graph.add_node("tools", ToolNode(AGENT_TOOLS))
+    # History is folded at the start of each user turn only, never between
+    # tool rounds, so the prefix stays put for the whole turn.
+    graph.set_entry_point("summarize")
+    graph.add_edge("summarize", "orchestrator")
+    graph.add_conditional_edges("orchestrator", _should_continue)
+    graph.add_edge("tools", "orchestrator")
 
-agent = _graph.compile(checkpointer=MemorySaver())
+    return graph.compile(checkpointer=MemorySaver())
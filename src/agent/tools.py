@@ -1,47 +1,96 @@
+import asyncio
+import multiprocessing
 import os
-import subprocess
 import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import cache
+from typing import TYPE_CHECKING
 
 from langchain_core.tools import tool
 
 from models.analysis_result import AnalysisResult
-from utils.code_refactorer import CodeRefactorer
-from utils.github_searcher import GitHubSearcher
+from utils.pytest_worker import ignore_sigint, run_pytest
 from utils.ruff_parser import RuffParser
+from utils.ruff_server import get_ruff_server
+
+if TYPE_CHECKING:
+    from utils.code_refactorer import CodeRefactorer
+    from utils.github_searcher import GitHubSearcher
 
 _parser = RuffParser()
-_STDIN_ARGS = ["--stdin-filename", "code.py", "-"]
 
-_github_searcher = GitHubSearcher()
-_code_refactorer = CodeRefactorer()
+
+# Built on first use: these pull in the LLM client, the GitHub loader and the
+# text splitters, none of which are needed to start the REPL.
+@cache
+def _get_code_refactorer() -> "CodeRefactorer":
+    from utils.code_refactorer import CodeRefactorer
+
+    return CodeRefactorer()
+
+
+@cache
+def _get_github_searcher() -> "GitHubSearcher":
+    from utils.github_searcher import GitHubSearcher
+
+    return GitHubSearcher()
+
+
+# Test files go to tmpfs when available so they never touch the disk.
+_TEST_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+# A test run that takes longer than this is assumed to hang and is killed.
+_TEST_TIMEOUT = 300.0
+
+# User tests run in one long-lived worker process, which keeps pytest imported
+# between calls.  Being a separate process, it can be killed when a test hangs
+# or the user hits Ctrl-C, and a test that exits or crashes cannot take the
+# REPL down with it.
+_pytest_pool: ProcessPoolExecutor | None = None
+# One run at a time, so a timeout only ever kills the run that caused it.
+_pytest_lock = asyncio.Lock()
+
+
+def _get_pytest_pool() -> ProcessPoolExecutor:
+    global _pytest_pool
+    if _pytest_pool is None:
+        # spawn rather than fork: this process has threads running.
+        _pytest_pool = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=ignore_sigint,
+        )
+    return _pytest_pool
+
+
+def _kill_pytest_pool() -> None:
+    """Stop the worker, even mid-test; the next run starts a fresh one."""
+    global _pytest_pool
+    pool, _pytest_pool = _pytest_pool, None
+    if pool is None:
+        return
+    # A running call cannot be cancelled, so the worker is killed.  It is the
+    # only multiprocessing child this process starts.
+    for process in multiprocessing.active_children():
+        process.kill()
+    pool.shutdown(wait=False, cancel_futures=True)
 
 
 # --- Tools ---
 
 
 @tool
-def lint(code: str) -> AnalysisResult:
+async def lint(code: str) -> AnalysisResult:
     """Lints Python code with ruff and returns violations."""
-    result = subprocess.run(
-        ["ruff", "check", "--output-format", "json", *_STDIN_ARGS],
-        input=code,
-        capture_output=True,
-        text=True,
-    )
-    violations = _parser.extract_violations(result.stdout)
+    diagnostics = await asyncio.to_thread(get_ruff_server().check, code)
+    violations = _parser.extract_violations(diagnostics)
     return AnalysisResult(code=code, violations=violations)
 
 
 @tool
-def format_code(code: str) -> str:
+async def format_code(code: str) -> str:
     """Formats Python code with ruff and returns the formatted version."""
-    result = subprocess.run(
-        ["ruff", "format", *_STDIN_ARGS],
-        input=code,
-        capture_output=True,
-        text=True,
-    )
-    return result.stdout
+    return await asyncio.to_thread(get_ruff_server().format, code)
 
 
 @tool
@@ -53,37 +102,48 @@ def refactor(code: str, instructions: str = "") -> str:
         instructions: Optional specific refactoring instructions
             (e.g. "use dataclasses", "split into smaller functions").
     """
-    return _code_refactorer.refactor_code(code=code, instructions=instructions)
+    return _get_code_refactorer().refactor_code(code=code, instructions=instructions)
 
 
 @tool
-def run_tests(test_code: str) -> str:
+async def run_tests(test_code: str) -> str:
     """Runs pytest on the provided Python test code and returns a pass/fail summary.
 
     Args:
         test_code: Self-contained, pytest-compatible Python test code.
     """
     with tempfile.NamedTemporaryFile(
-        mode="w", suffix="_test.py", prefix="devtools_", delete=False
+        mode="w", suffix="_test.py", prefix="devtools_", dir=_TEST_DIR, delete=False
     ) as tmp:
         tmp.write(test_code)
         tmp_path = tmp.name
 
     try:
-        result = subprocess.run(
-            ["pytest", tmp_path, "-v", "--tb=short"],
-            capture_output=True,
-            text=True,
-        )
-        output = (result.stdout + result.stderr).strip()
-        status = "PASSED" if result.returncode == 0 else "FAILED"
-        return f"Tests {status} (exit code {result.returncode})\n\n{output}"
+        async with _pytest_lock:
+            try:
+                exit_code, output = await asyncio.wait_for(
+                    asyncio.wrap_future(
+                        _get_pytest_pool().submit(run_pytest, tmp_path)
+                    ),
+                    _TEST_TIMEOUT,
+                )
+            except TimeoutError:
+                _kill_pytest_pool()
+                return f"Tests TIMED OUT after {_TEST_TIMEOUT:.0f}s and were stopped"
+            except BrokenProcessPool:
+                _kill_pytest_pool()
+                return "Tests FAILED: the test process exited before pytest finished"
+            except asyncio.CancelledError:
+                _kill_pytest_pool()
+                raise
+        status = "PASSED" if exit_code == 0 else "FAILED"
+        return f"Tests {status} (exit code {exit_code})\n\n{output.strip()}"
     finally:
         os.unlink(tmp_path)
 
 
 @tool
-def index_github_repositories(query: str, max_repos: int = 3) -> str:
+async def index_github_repositories(query: str, max_repos: int = 3) -> str:
     """Searches GitHub for Python repositories matching a query and indexes their
     source code into the vector store so it can be used as context during refactoring.
 
@@ -92,7 +152,9 @@ def index_github_repositories(query: str, max_repos: int = 3) -> str:
             (e.g. "data validation", "async web framework", "CLI tools").
         max_repos: Number of top-starred repositories to index (default: 3, capped at 5)
     """
-    return _github_searcher.index_repositories(query, max_repos)
+    # Each repository is a full download and embedding run, so the model is
+    # kept to a handful per call.
+    return await _get_github_searcher().index_repositories(query, min(max_repos, 5))
 
 
 AGENT_TOOLS = [lint, format_code, refactor, run_tests, index_github_repositories]
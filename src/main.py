@@ -1,8 +1,15 @@
+import asyncio
+import sys
+from collections.abc import AsyncIterator
+from typing import Any
 from uuid import uuid4
 
-from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
-
-from agent.agent import agent
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    ToolMessage,
+)
 
 BANNER = """
 ╔══════════════════════════════════════════╗
@@ -32,26 +39,36 @@ def _read_user_input() -> str | None:
     return "\n".join(lines).strip() or None
 
 
-def _format_response(result: dict) -> str:
-    """Extract a readable response from the agent's message list."""
-    messages = result.get("messages", [])
-    parts: list[str] = []
-
-    for msg in messages:
+async def _print_stream(
+    stream: AsyncIterator[tuple[BaseMessage, dict[str, Any]]],
+) -> None:
+    """Print orchestrator tokens as they arrive and each tool result once done."""
+    async for msg, metadata in stream:
         if isinstance(msg, ToolMessage):
-            parts.append(f"  [tool: {msg.name}]  {msg.content}")
-        elif isinstance(msg, AIMessage) and msg.content:
-            parts.append(msg.content)
-
-    return "\n\n".join(parts) if parts else str(result)
+            print(f"\n  [tool: {msg.name}]  {msg.content}\n")
+        elif (
+            isinstance(msg, AIMessage)
+            and msg.text
+            and metadata.get("langgraph_node") == "orchestrator"
+        ):
+            # .text joins the text blocks when content is a list of blocks.
+            sys.stdout.write(msg.text)
+            sys.stdout.flush()
+    print()
 
 
-def main() -> None:
+async def main() -> None:
     thread_id = str(uuid4())
     print(BANNER)
     print(f"Session ID: {thread_id}")
     print()
 
+    # Imported after the banner: loading LangChain/LangGraph takes about a
+    # second, and the user should see the REPL come up before paying for it.
+    from agent.agent import get_agent
+
+    agent = get_agent()
+
     config = {"configurable": {"thread_id": thread_id}}
 
     while True:
@@ -60,19 +77,22 @@ def main() -> None:
             print("\nBye!")
             break
 
+        print(f"\n{SEPARATOR}")
         try:
-            result = agent.invoke({"messages": [HumanMessage(user_text)]}, config)
+            await _print_stream(
+                agent.astream(
+                    {"messages": [HumanMessage(user_text)]},
+                    config,
+                    stream_mode="messages",
+                )
+            )
         except Exception as exc:
             print(f"\n⚠  Agent error: {exc}\n")
-            continue
-
-        print(f"\n{SEPARATOR}")
-        print(_format_response(result))
         print(SEPARATOR)
 
 
 if __name__ == "__main__":
     try:
-        main()
+        asyncio.run(main())
     except KeyboardInterrupt:
         print("\nBye!")
@@ -1,3 +1,5 @@
+from collections.abc import Callable
+
 from langchain_core.documents import Document
 from langchain_text_splitters import Language, RecursiveCharacterTextSplitter
 
@@ -6,14 +8,26 @@ class CodeSplitter:
     """
     Splits Python source documents into smaller chunks using AST-aware boundaries
     (classes, functions, etc.) provided by RecursiveCharacterTextSplitter.
+
+    Sizes are measured with `length_function`: characters by default, or e.g. a
+    token counter when chunks have to fit a model's prompt budget.
     """
 
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 100) -> None:
+    def __init__(
+        self,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 100,
+        length_function: Callable[[str], int] = len,
+    ) -> None:
         self._splitter = RecursiveCharacterTextSplitter.from_language(
             language=Language.PYTHON,
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
+            length_function=length_function,
         )
 
     def split(self, documents: list[Document]) -> list[Document]:
         return self._splitter.split_documents(documents)
+
+    def split_text(self, text: str) -> list[str]:
+        return self._splitter.split_text(text)
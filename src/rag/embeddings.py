@@ -0,0 +1,130 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import cast
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embedding model with a persistent cache keyed on text content.
+
+    Vectors are stored as float32 blobs in SQLite under the SHA-256 of the
+    model name and the text, so re-indexing a repository only runs the encoder
+    on chunks it has never seen, and repeated queries skip it entirely.  Once
+    the cache holds *max_entries* vectors, the least recently used ones are
+    evicted.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model: str,
+        path: str | Path,
+        max_entries: int = 100_000,
+    ) -> None:
+        self._embeddings = embeddings
+        # Part of every key: vectors from different models must never mix.
+        self._model = model.encode()
+        self._max_entries = max_entries
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # Indexing and retrieval run on worker threads, so the connection is
+        # shared across threads and serialised with a lock.
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS vectors "
+                "(key BLOB PRIMARY KEY, vec BLOB, used REAL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS vectors_used ON vectors (used)"
+            )
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [self._key(b"document", text) for text in texts]
+        vectors = self._lookup(keys)
+
+        # Each distinct missing text is encoded once, and all of them go to the
+        # encoder in a single call so it can batch them.
+        misses = {
+            key: text
+            for key, text, vector in zip(keys, texts, vectors, strict=True)
+            if vector is None
+        }
+        if misses:
+            computed = self._embeddings.embed_documents(list(misses.values()))
+            stored = dict(zip(misses, self._store(list(misses), computed), strict=True))
+            vectors = [
+                stored[key] if vector is None else vector
+                for key, vector in zip(keys, vectors, strict=True)
+            ]
+        return vectors  # type: ignore[return-value]
+
+    def embed_query(self, text: str) -> list[float]:
+        # Queries are cached separately: some models embed them differently.
+        key = self._key(b"query", text)
+        [vector] = self._lookup([key])
+        if vector is None:
+            [vector] = self._store([key], [self._embeddings.embed_query(text)])
+        return vector
+
+    def _key(self, kind: bytes, text: str) -> bytes:
+        return hashlib.sha256(
+            self._model + b"\0" + kind + b"\0" + text.encode()
+        ).digest()
+
+    def _lookup(self, keys: list[bytes]) -> list[list[float] | None]:
+        found: dict[bytes, bytes] = {}
+        with self._lock, self._db:
+            # Stay under SQLite's limit on bound parameters per statement.
+            for start in range(0, len(keys), 500):
+                batch = keys[start : start + 500]
+                placeholders = ",".join("?" * len(batch))
+                found.update(
+                    self._db.execute(
+                        f"SELECT key, vec FROM vectors WHERE key IN ({placeholders})",
+                        batch,
+                    )
+                )
+            # Hits count as uses, so eviction drops the least recently used.
+            now = time.time()
+            self._db.executemany(
+                "UPDATE vectors SET used = ? WHERE key = ?",
+                ((now, key) for key in found),
+            )
+        return [
+            np.frombuffer(found[key], np.float32).tolist() if key in found else None
+            for key in keys
+        ]
+
+    def _store(
+        self, keys: list[bytes], vectors: list[list[float]]
+    ) -> list[list[float]]:
+        """Cache *vectors* and return them as stored, i.e. rounded to float32."""
+        matrix = np.asarray(vectors, np.float32)
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO vectors (key, vec, used) VALUES (?, ?, ?)",
+                zip(
+                    keys,
+                    (row.tobytes() for row in matrix),
+                    [now] * len(keys),
+                    strict=True,
+                ),
+            )
+            [entries] = self._db.execute("SELECT COUNT(*) FROM vectors").fetchone()
+            if entries > self._max_entries:
+                self._db.execute(
+                    "DELETE FROM vectors WHERE key IN "
+                    "(SELECT key FROM vectors ORDER BY used LIMIT ?)",
+                    (entries - self._max_entries,),
+                )
+        # Returning the rounded values keeps a text's vector identical whether
+        # it was just computed or read back from the cache.
+        return cast(list[list[float]], matrix.tolist())
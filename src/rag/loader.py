@@ -1,6 +1,13 @@
-from langchain_community.document_loaders import GithubFileLoader
+import asyncio
+import hashlib
+import tarfile
+import tempfile
+from typing import IO
 
-from config import config
+import httpx
+from langchain_core.documents import Document
+
+from utils.http import github_async_client
 
 
 class RepositoryLoader:
@@ -8,31 +15,29 @@ class RepositoryLoader:
     RepositoryLoader is responsible for loading Python files
     from a specified GitHub repository.
 
-    This class utilizes the GithubFileLoader from langchain_community to fetch files
-    from a given GitHub repository, specifically targeting Python (.py) files by default
-    The loader requires a valid GitHub access token and repository details to perform
-    its operation.
+    The repository is downloaded as a single gzipped tarball, and its Python
+    (.py) files are read straight out of the archive.  The loader requires a
+    valid GitHub access token (read from the environment configuration by the
+    shared GitHub client) and repository details to perform its operation.
 
     Attributes:
-        ACCESS_TOKEN (str): GitHub access token, sourced from environment configuration.
-        loader (GithubFileLoader): An instance of GithubFileLoader
-        that performs the file loading.
+        repository_name (str): The repository to load, as owner/repo_name.
 
     Methods:
-        __init__():
-            Initializes the RepositoryLoader and sets the GitHub access token.
-
         load_repository(repository_name: str, creator: str):
             Prepares the loader to fetch Python files from the specified repository
             and owner/creator.
 
-        get_repository_documents():
+        aget_repository_documents(client: httpx.AsyncClient | None = None):
             Loads and returns all Python files (as Document objects) from the previously
-            specified repository.
+            specified repository, optionally over a caller's shared client.
+
+        get_repository_documents():
+            Synchronous wrapper around `aget_repository_documents`.
     """
 
-    def __init__(self) -> None:
-        self.ACCESS_TOKEN = config.environment.GITHUB_ACCESS_TOKEN
+    # Tarballs up to this size stay in memory; larger ones spill to disk.
+    _MAX_IN_MEMORY_ARCHIVE = 32 * 1024 * 1024
 
     # TODO: add the possibility to analyze further types
     def load_repository(self, repository_name: str, creator: str):
@@ -47,21 +52,72 @@ class RepositoryLoader:
         Returns:
             - None
         """
-        self.loader = GithubFileLoader(
-            repo=repository_name,
-            access_token=self.ACCESS_TOKEN,
-            creator=creator,
-            include_prs=False,
-            github_api_url="https://api.github.com",
-            file_filter=lambda file_path: file_path.endswith(".py"),
-        )
-
-    def get_repository_documents(self):
+        self.repository_name = repository_name
+
+    async def aget_repository_documents(
+        self, client: httpx.AsyncClient | None = None
+    ) -> list[Document]:
         """
         Gets all Python files inside the repository.
+        Args:
+            - `client`: GitHub client to download with, e.g. one shared by several
+              concurrent loads; a new one is opened for this call if omitted.
         Returns:
             - List[Document]: a list of documents with the following structure:
                 - page_content: literal content
-                - metadata: a dictionary containing the document's me
+                - metadata: a dictionary containing the document's path, blob
+                  SHA and source URL
         """
-        return self.loader.load()
+        if client is None:
+            async with github_async_client() as client:
+                return await self.aget_repository_documents(client)
+
+        repo = self.repository_name
+        # One request for the whole repository instead of one per file.  The
+        # archive is streamed into a spooled file so a large repository does
+        # not have to fit in memory.
+        with tempfile.SpooledTemporaryFile(self._MAX_IN_MEMORY_ARCHIVE) as archive:
+            async with client.stream(
+                "GET", f"/repos/{repo}/tarball", timeout=60.0
+            ) as resp:
+                resp.raise_for_status()
+                async for chunk in resp.aiter_bytes():
+                    archive.write(chunk)
+            archive.seek(0)
+            # Decompressing is CPU-bound, so it is kept off the event loop.
+            return await asyncio.to_thread(_read_python_files, archive, repo)
+
+    def get_repository_documents(self) -> list[Document]:
+        """Synchronous wrapper around `aget_repository_documents`."""
+        return asyncio.run(self.aget_repository_documents())
+
+
+def _read_python_files(archive: IO[bytes], repo: str) -> list[Document]:
+    """Return a Document for every non-empty .py file in a repository tarball."""
+    documents = []
+    with tarfile.open(fileobj=archive, mode="r|gz") as tar:
+        for member in tar:
+            if not (member.isfile() and member.name.endswith(".py")):
+                continue
+            file = tar.extractfile(member)
+            if file is None:
+                continue
+            data = file.read()
+            if not data:
+                continue
+            # Archive paths start with an "<owner>-<repo>-<sha>/" directory.
+            path = member.name.partition("/")[2]
+            documents.append(
+                Document(
+                    page_content=data.decode("utf-8", errors="replace"),
+                    metadata={
+                        "path": path,
+                        # The same SHA git and the GitHub API give the blob.
+                        "sha": hashlib.sha1(
+                            b"blob %d\0" % len(data) + data, usedforsecurity=False
+                        ).hexdigest(),
+                        "source": f"https://github.com/{repo}/blob/HEAD/{path}",
+                    },
+                )
+            )
+    return documents
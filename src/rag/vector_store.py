@@ -1,37 +1,227 @@
-from langchain_community.vectorstores import Chroma
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+import orjson
+import torch
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
 from langchain_core.documents import Document
-from langchain_core.vectorstores import VectorStoreRetriever
+from langchain_core.retrievers import BaseRetriever
 from langchain_huggingface import HuggingFaceEmbeddings
 
+from rag.embeddings import CachedEmbeddings
+
 
 class CodeVectorStore:
     """
-    Embeds and persists Python code chunks in a Chroma vector store.
+    Embeds and persists Python code chunks for exact similarity search.
 
-    On first run the collection is built from scratch and written to disk.
-    On subsequent runs the existing collection is loaded from disk automatically,
-    so documents are indexed only once.  Call `add_documents` to refresh with
-    new or updated chunks.
+    Vectors live in one contiguous float32 matrix and a query is a single
+    matrix-vector product against it, which for this store's size is both
+    exact and faster than an approximate index.  The matrix and the chunks are
+    written to disk after every add and loaded back on start-up, so documents
+    are indexed only once.  Chunks tagged with a `source_repo` metadata entry
+    let callers skip repositories that are already in the store.
     """
 
-    _COLLECTION = "python_code"
     # Lightweight model that ships with sentence-transformers and works well
     # for code similarity.  Swap for e.g. "nomic-ai/nomic-embed-text-v1" if
     # you want a larger, code-oriented model.
     _EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+    # Must match the model above; a store saved with another size is ignored.
+    _EMBEDDING_DIMENSIONS = 384
+    # 1024 x 384 float32 is 1.5 MB, enough for a few repositories before the
+    # first reallocation.
+    _INITIAL_CAPACITY = 1024
 
-    def __init__(self, persist_directory: str = ".chroma") -> None:
-        embeddings = HuggingFaceEmbeddings(model_name=self._EMBEDDING_MODEL)
-        self._store = Chroma(
-            collection_name=self._COLLECTION,
-            embedding_function=embeddings,
-            persist_directory=persist_directory,
+    def __init__(self, persist_directory: str = ".vector_store") -> None:
+        self._directory = Path(persist_directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        # The encoder is loaded on the first embed, so opening the store to
+        # check what is already indexed stays cheap.
+        self._embeddings: CachedEmbeddings | None = None
+        self._embeddings_lock = threading.Lock()
+        # Rows past _count are spare capacity, so most adds write in place
+        # instead of reallocating the whole matrix.
+        self._vectors = np.empty(
+            (self._INITIAL_CAPACITY, self._EMBEDDING_DIMENSIONS), np.float32
         )
+        self._count = 0
+        self._documents: list[Document] = []
+        self._repositories: set[str] = set()
+        self._lock = threading.Lock()
+        self._load()
+
+    def add_documents(
+        self, documents: list[Document], insert_batch_size: int = 256
+    ) -> None:
+        """Index a list of (split) documents.  Safe to call multiple times.
 
-    def add_documents(self, documents: list[Document]) -> None:
-        """Index a list of (split) documents.  Safe to call multiple times."""
-        self._store.add_documents(documents)
+        Documents are embedded *insert_batch_size* at a time, which keeps the
+        encoder's batches full without building one huge list of floats.
+        Nothing is stored unless every batch embeds, so a failure never leaves
+        a repository half-indexed yet reported by `has_repository`.
+        """
+        if not documents:
+            return
+        batches: list[np.ndarray] = []
+        for start in range(0, len(documents), insert_batch_size):
+            batch = documents[start : start + insert_batch_size]
+            vectors = self._get_embeddings().embed_documents(
+                [d.page_content for d in batch]
+            )
+            batches.append(_normalize(np.asarray(vectors, np.float32)))
+        with self._lock:
+            self._append(np.concatenate(batches), documents)
+            self._save()
+
+    def similarity_search(self, query: str, k: int = 5) -> list[Document]:
+        """Return the *k* chunks whose embeddings best match *query*."""
+        # An empty store has nothing to rank, so the encoder is not loaded.
+        with self._lock:
+            if not self._count:
+                return []
+        query_vector = _normalize(
+            np.asarray(self._get_embeddings().embed_query(query), np.float32)
+        )
+        with self._lock:
+            vectors = self._vectors[: self._count]
+            documents = self._documents[: self._count]
+        # Both sides are unit vectors, so the inner product is cosine similarity.
+        scores = vectors @ query_vector
+        if k < len(scores):
+            # Select the k best in linear time, then sort only those.
+            top = np.argpartition(scores, -k)[-k:]
+            top = top[np.argsort(scores[top])[::-1]]
+        else:
+            top = np.argsort(scores)[::-1]
+        return [documents[i] for i in top]
 
-    def as_retriever(self, k: int = 5) -> VectorStoreRetriever:
+    def as_retriever(self, k: int = 5) -> BaseRetriever:
         """Return a retriever that fetches the *k* most similar chunks."""
-        return self._store.as_retriever(search_kwargs={"k": k})
+        return _CodeRetriever(store=self, k=k)
+
+    def has_repository(self, full_name: str) -> bool:
+        """Return whether chunks tagged with `source_repo` *full_name* are stored."""
+        with self._lock:
+            return full_name in self._repositories
+
+    def _get_embeddings(self) -> CachedEmbeddings:
+        with self._embeddings_lock:
+            if self._embeddings is None:
+                # Chunks already embedded in an earlier run are served from the
+                # cache instead of going through the encoder again.
+                self._embeddings = CachedEmbeddings(
+                    _load_encoder(self._EMBEDDING_MODEL),
+                    self._EMBEDDING_MODEL,
+                    self._directory / "emb_cache.db",
+                )
+            return self._embeddings
+
+    def _append(self, vectors: np.ndarray, documents: list[Document]) -> None:
+        needed = self._count + len(vectors)
+        if needed > len(self._vectors):
+            # Grow geometrically so repeated adds stay amortised O(1) per row.
+            grown = np.empty(
+                (max(needed, 2 * len(self._vectors)), self._EMBEDDING_DIMENSIONS),
+                np.float32,
+            )
+            grown[: self._count] = self._vectors[: self._count]
+            self._vectors = grown
+        self._vectors[self._count : needed] = vectors
+        self._documents.extend(documents)
+        self._repositories.update(
+            d.metadata["source_repo"] for d in documents if "source_repo" in d.metadata
+        )
+        self._count = needed
+
+    def _save(self) -> None:
+        # Written to temporary files and renamed, so an interrupted save never
+        # leaves a half-written store behind.
+        vectors_path = self._directory / "vectors.npy"
+        documents_path = self._directory / "documents.json"
+        with open(vectors_path.with_suffix(".tmp"), "wb") as f:
+            np.save(f, self._vectors[: self._count])
+        documents_path.with_suffix(".tmp").write_bytes(
+            orjson.dumps(
+                [
+                    {"page_content": d.page_content, "metadata": d.metadata}
+                    for d in self._documents
+                ]
+            )
+        )
+        os.replace(vectors_path.with_suffix(".tmp"), vectors_path)
+        os.replace(documents_path.with_suffix(".tmp"), documents_path)
+
+    def _load(self) -> None:
+        vectors_path = self._directory / "vectors.npy"
+        documents_path = self._directory / "documents.json"
+        if not (vectors_path.exists() and documents_path.exists()):
+            return
+        vectors = np.load(vectors_path)
+        documents = [Document(**d) for d in orjson.loads(documents_path.read_bytes())]
+        if vectors.shape == (len(documents), self._EMBEDDING_DIMENSIONS):
+            self._append(vectors, documents)
+
+
+def _load_encoder(model_name: str) -> HuggingFaceEmbeddings:
+    """Load *model_name* in the fastest form the host supports."""
+    # Same device preference as sentence-transformers' own default.
+    if torch.cuda.is_available():
+        device = "cuda"
+    elif torch.backends.mps.is_available():
+        device = "mps"
+    else:
+        device = "cpu"
+    embeddings = HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={"device": device},
+        encode_kwargs={
+            "batch_size": 128 if device == "cuda" else 64,
+            "normalize_embeddings": True,
+        },
+    )
+    model = embeddings._client
+    transformer = model[0].auto_model
+    # Both optimisations below depend on the host's torch build, so each is
+    # tried on a warm-up batch and dropped if it fails, rather than failing
+    # on the first real embed.
+    try:
+        if device == "cuda":
+            # fp16 halves the bytes moved through the transformer and runs on
+            # the tensor cores.  Batches are padded to different lengths, so
+            # the model is compiled with dynamic shapes rather than CUDA
+            # graphs; compiling needs Triton and a C compiler.
+            model.half()
+            model[0].auto_model = torch.compile(transformer, dynamic=True)
+        elif device == "cpu":
+            # int8 weights for the linear layers, which dominate MiniLM's CPU
+            # time.  Needs a quantized engine (fbgemm or qnnpack).
+            model[0].auto_model = torch.ao.quantization.quantize_dynamic(
+                transformer, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        embeddings.embed_documents(["def f(): pass"])
+    except Exception:
+        # Keeps fp16 on CUDA, which every GPU supports, and fp32 on CPU.
+        model[0].auto_model = transformer
+    return embeddings
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale *vectors* (one per row, or a single one) to unit length in place."""
+    # The encoder is asked for normalized output already; this makes the
+    # store's cosine ranking independent of how the model was configured.
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+class _CodeRetriever(BaseRetriever):
+    store: CodeVectorStore
+    k: int
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        return self.store.similarity_search(query, self.k)
@@ -1,58 +1,179 @@
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
+import hashlib
+import sqlite3
+import threading
+import time
+from functools import cache
+
+import tiktoken
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.retrievers import BaseRetriever
 from langchain_ollama import ChatOllama
 
+from rag.code_splitter import CodeSplitter
 from utils.vector_store_singleton import get_vector_store
 
+# Prompt cost grows with its token count, so the code and the retrieved
+# context are capped.  Together they stay well inside the 8192-token num_ctx.
+_MAX_CODE_TOKENS = 3000
+_MAX_CONTEXT_TOKENS = 1500
+# A few more chunks are retrieved than are used, so duplicates and chunks of
+# the input itself can be dropped without running short.
+_RETRIEVED_SNIPPETS = 5
+_CONTEXT_SNIPPETS = 3
+_MAX_SNIPPET_CHARS = 800
+
+# Refactored code is cached by model, code and instructions for a week, so
+# asking for the same refactor again skips both retrieval and generation.
+_CACHE_PATH = ".refactor_cache.db"
+_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# The prompt is fixed, so it is built once here and assembled from plain
+# strings on each call instead of going through ChatPromptTemplate and an
+# LCEL chain.
+_SYSTEM_MESSAGE = SystemMessage(
+    "You are an expert Python developer. Refactor the provided code to "
+    "improve readability, follow PEP 8, use idiomatic Python, and apply "
+    "type hints where appropriate.\n\n"
+    "Return ONLY the refactored Python code — no explanation, no markdown "
+    "fences, no commentary."
+)
+_CODE_TEMPLATE = "Code to refactor:\n```python\n{code}\n```"
+_CONTEXT_TEMPLATE = "Similar code patterns for reference:\n```python\n{context}\n```"
+
+
+@cache
+def _encoding() -> tiktoken.Encoding | None:
+    # Not llama3.1's own tokenizer, but close enough to budget the prompt.
+    # tiktoken downloads the encoding on first use, which fails offline.
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def _count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        # Roughly four characters per token for English text and code.
+        return len(text) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _budget(code: str, max_tokens: int = _MAX_CODE_TOKENS) -> tuple[str, bool]:
+    """Cut *code* at a statement boundary to fit *max_tokens*.
+
+    Returns the (possibly shortened) code and whether it was cut.
+    """
+    if _count_tokens(code) <= max_tokens:
+        return code, False
+    splitter = CodeSplitter(
+        chunk_size=max_tokens, chunk_overlap=0, length_function=_count_tokens
+    )
+    return splitter.split_text(code)[0], True
+
 
 class CodeRefactorer:
     def __init__(self) -> None:
-        self._refactor_llm = ChatOllama(model="llama3.1", temperature=0.2)
-
-        _REFACTOR_PROMPT = ChatPromptTemplate.from_messages(
-            [
-                (
-                    "system",
-                    "You are an expert Python developer. Refactor the provided code to "
-                    "improve readability, follow PEP 8, use idiomatic Python, and apply "  # noqa: E501
-                    "type hints where appropriate.\n\n"
-                    "Return ONLY the refactored Python code — no explanation, no markdown "  # noqa: E501
-                    "fences, no commentary.",
-                ),
-                (
-                    "human",
-                    "Code to refactor:\n```python\n{code}\n```\n\n"
-                    "{instructions_section}\n\n"
-                    "{context_section}",
-                ),
-            ]
+        # Same keep_alive/num_ctx as the orchestrator: a different context size
+        # would make Ollama reload llama3.1 every time the two alternate.
+        self._refactor_llm = ChatOllama(
+            model="llama3.1", temperature=0.2, keep_alive="30m", num_ctx=8192
+        )
+        self._retriever: BaseRetriever | None = None
+        # The refactor tool runs on worker threads, so the connection is shared
+        # across threads and serialised with a lock.
+        self._cache = sqlite3.connect(_CACHE_PATH, check_same_thread=False)
+        self._cache.execute(
+            "CREATE TABLE IF NOT EXISTS refactors "
+            "(key TEXT PRIMARY KEY, result TEXT, created REAL)"
         )
+        self._cache_lock = threading.Lock()
+
+    def _refactor_invoke(self, sections: list[str]) -> str:
+        # Sections with nothing to say are left out entirely rather than sent
+        # as blank lines.
+        human_message = HumanMessage("\n\n".join(s for s in sections if s))
+        return self._refactor_llm.invoke([_SYSTEM_MESSAGE, human_message]).text
 
-        self._refactor_chain = _REFACTOR_PROMPT | self._refactor_llm | StrOutputParser()
+    def _get_retriever(self) -> BaseRetriever:
+        # Built once per process rather than on every refactor call.
+        if self._retriever is None:
+            self._retriever = get_vector_store().as_retriever(k=_RETRIEVED_SNIPPETS)
+        return self._retriever
 
-    def _rag_context(self, query: str) -> str:
-        """Return RAG-retrieved code snippets, or an empty string if unavailable."""
+    def _rag_context(self, code: str) -> str:
+        """Return code snippets similar to *code*, or an empty string if unavailable."""
         try:
-            docs = get_vector_store().as_retriever(k=3).invoke(query)
-            return "\n\n---\n\n".join(d.page_content for d in docs)
+            docs = self._get_retriever().invoke(code[:500])
         except Exception:
             return ""
 
+        snippets: list[str] = []
+        seen: set[str] = set()
+        used_tokens = 0
+        for doc in docs:
+            content = doc.page_content
+            head = content[:200]
+            # Skip repeats (the same file indexed twice, overlapping chunks)
+            # and chunks of the very code being refactored.
+            if head in seen or head in code:
+                continue
+            seen.add(head)
+            if len(content) > _MAX_SNIPPET_CHARS:
+                # Cut at a line break so the snippet does not end mid-line.
+                cut = content[:_MAX_SNIPPET_CHARS]
+                content = cut.rpartition("\n")[0] or cut
+            used_tokens += _count_tokens(content)
+            if used_tokens > _MAX_CONTEXT_TOKENS:
+                break
+            snippets.append(content)
+            if len(snippets) == _CONTEXT_SNIPPETS:
+                break
+        return "\n\n---\n\n".join(snippets)
+
+    def _cache_key(self, code: str, instructions: str) -> str:
+        # The RAG context is left out: it shifts as repositories are indexed,
+        # and including it would make almost every lookup miss.
+        text = f"{self._refactor_llm.model}\0{code}\0{instructions}"
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _cached(self, key: str) -> str | None:
+        with self._cache_lock:
+            row = self._cache.execute(
+                "SELECT result FROM refactors WHERE key = ? AND created > ?",
+                (key, time.time() - _CACHE_TTL_SECONDS),
+            ).fetchone()
+        return row[0] if row else None
+
+    def _cache_result(self, key: str, result: str) -> None:
+        now = time.time()
+        with self._cache_lock, self._cache:
+            self._cache.execute(
+                "INSERT OR REPLACE INTO refactors VALUES (?, ?, ?)", (key, result, now)
+            )
+            self._cache.execute(
+                "DELETE FROM refactors WHERE created <= ?", (now - _CACHE_TTL_SECONDS,)
+            )
+
     def refactor_code(self, code: str, instructions: str) -> str:
-        context = self._rag_context(code[:500])
+        key = self._cache_key(code, instructions)
+        if (cached := self._cached(key)) is not None:
+            return cached
 
-        instructions_section = (
-            f"Specific instructions: {instructions}" if instructions else ""
-        )
-        context_section = (
-            f"Similar code patterns for reference:\n```python\n{context}\n```"
-            if context
-            else ""
-        )
-        return self._refactor_chain.invoke(
-            {
-                "code": code,
-                "instructions_section": instructions_section,
-                "context_section": context_section,
-            }
+        code, truncated = _budget(code)
+        context = self._rag_context(code)
+
+        notes: list[str] = []
+        if instructions:
+            notes.append(f"Specific instructions: {instructions}")
+        if truncated:
+            notes.append("The code was cut to fit the prompt; refactor only that part.")
+        result = self._refactor_invoke(
+            [
+                _CODE_TEMPLATE.format(code=code),
+                "\n".join(notes),
+                _CONTEXT_TEMPLATE.format(context=context) if context else "",
+            ]
         )
+        self._cache_result(key, result)
+        return result
@@ -1,86 +1,166 @@
-import json
-import urllib
+import asyncio
+import contextlib
+from typing import TypedDict
 
-from config import config
+import httpx
+import orjson
+from langchain_core.documents import Document
+
+from config.config import config
 from rag.code_splitter import CodeSplitter
 from rag.loader import RepositoryLoader
-from rag.vector_store import CodeVectorStore
+from utils.http import GITHUB_CLIENT, github_async_client
 from utils.vector_store_singleton import get_vector_store
 
+# Each repository load is a full tarball download, so only a few run at once
+# to bound bandwidth and memory.
+_MAX_CONCURRENT_REPOS = 4
+
+
+class _Repository(TypedDict):
+    """The fields of a GitHub search result that indexing uses."""
+
+    full_name: str
+    stargazers_count: int
+
 
 class GitHubSearcher:
     def __init__(self) -> None:
-        pass
+        # Search responses by request parameters, with the ETag GitHub sent.
+        # A conditional request that comes back 304 Not Modified reuses the
+        # stored items and does not count against the rate limit.
+        self._etag_cache: dict[tuple[str, int], tuple[str, list[_Repository]]] = {}
 
-    def index_repositories(self, query: str, max_repos: int = 3) -> str:
+    async def index_repositories(self, query: str, max_repos: int = 3) -> str:
         token = config.environment.GITHUB_ACCESS_TOKEN
         if not token:
             return (
                 "Error: GITHUB_ACCESS_TOKEN is not set in .env — cannot search GitHub."
             )
 
-        repos = self._get_repos(max_repos=max_repos, token=token, query=query)
+        repos = await asyncio.to_thread(
+            self._get_repos, max_repos=max_repos, query=query
+        )
+        if not repos:
+            return f"No repositories found for query: {query!r}"
 
-        loader = RepositoryLoader()
         splitter = CodeSplitter()
-        store = get_vector_store()
+
+        # Repositories are fetched concurrently.  A single writer embeds each
+        # repository's chunks as soon as they are split, so encoding (and
+        # loading the model the first time) overlaps the downloads still in
+        # flight, while adds to the store stay sequential.
+        semaphore = asyncio.Semaphore(_MAX_CONCURRENT_REPOS)
+        pending: asyncio.Queue[tuple[str, list[Document]] | None] = asyncio.Queue()
+        # Repositories whose chunks could not be added, with the reason.
+        failures: dict[str, Exception] = {}
+
+        async def fetch(repo: _Repository) -> tuple[str, str]:
+            async with semaphore:
+                repository_info, chunks = await self._fetch_and_split(
+                    repo, splitter, client
+                )
+            if chunks:
+                pending.put_nowait((repo["full_name"], chunks))
+            return repo["full_name"], repository_info
+
+        async def write() -> None:
+            while (item := await pending.get()) is not None:
+                full_name, chunks = item
+                # One repository failing to embed does not stop the others.
+                try:
+                    store = await asyncio.to_thread(get_vector_store)
+                    await asyncio.to_thread(store.add_documents, chunks)
+                except Exception as exc:
+                    failures[full_name] = exc
+
+        writer = asyncio.create_task(write())
+        try:
+            # All downloads in this run share one connection pool.
+            async with github_async_client() as client:
+                results = await asyncio.gather(*(fetch(repo) for repo in repos))
+            pending.put_nowait(None)
+            await writer
+        finally:
+            # On an error or cancellation, stop the writer instead of leaving it
+            # waiting on the queue forever.
+            if not writer.done():
+                writer.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await writer
 
         count = len(repos)
         summary_lines = [
-            f"Indexing {count} repositor{'y' if count == 1 else 'ies'} for '{query}':"
+            f"Indexing {count} repositor{'y' if count == 1 else 'ies'} for '{query}':",
+            *(
+                f"  - {full_name} — failed to index: {failures[full_name]}"
+                if full_name in failures
+                else repository_info
+                for full_name, repository_info in results
+            ),
         ]
-
-        for repo in repos:
-            full_name = repo["full_name"]
-            owner = full_name.split("/", 1)[0]
-            stars = repo.get("stargazers_count", 0)
-            repository_info = self._store_repo_info(
-                full_name, owner, stars, loader, splitter, store
-            )
-            summary_lines.append(repository_info)
-
         return "\n".join(summary_lines)
 
-    def _get_repos(self, max_repos: int, token: str, query: str):
-        max_repos = min(max_repos, 5)
+    def _get_repos(self, max_repos: int, query: str) -> list[_Repository]:
+        """Return the top-starred Python repositories matching *query*."""
+        # GitHub returns at most 100 results per page.
+        max_repos = min(max_repos, 100)
+        key = (query, max_repos)
+        cached = self._etag_cache.get(key)
+        headers = {"If-None-Match": cached[0]} if cached else {}
 
-        search_url = (
-            "https://api.github.com/search/repositories"
-            f"?q={urllib.parse.quote(query)}+language:python"
-            f"&sort=stars&order=desc&per_page={max_repos}"
-        )
-        req = urllib.request.Request(
-            search_url,
-            headers={
-                "Authorization": f"Bearer {token}",
-                "Accept": "application/vnd.github+json",
-                "X-GitHub-Api-Version": "2022-11-28",
+        resp = GITHUB_CLIENT.get(
+            "/search/repositories",
+            params={
+                "q": f"{query} language:python",
+                "sort": "stars",
+                "order": "desc",
+                "per_page": max_repos,
             },
+            headers=headers,
         )
-        with urllib.request.urlopen(req) as resp:
-            data = json.loads(resp.read())
+        if cached and resp.status_code == 304:
+            return cached[1]
+        resp.raise_for_status()
 
-        repos = data.get("items", [])
-        if not repos:
-            return f"No repositories found for query: {query!r}"
+        # Each search item is a large object (owner, license, topics, URLs...);
+        # only what indexing needs is kept, since the list is also cached.
+        repos = [
+            _Repository(
+                full_name=item["full_name"],
+                stargazers_count=item["stargazers_count"],
+            )
+            for item in orjson.loads(resp.content).get("items", [])[:max_repos]
+        ]
+        if etag := resp.headers.get("ETag"):
+            self._etag_cache[key] = (etag, repos)
+        return repos
 
-    def _store_repo_info(
-        self,
-        full_name: str,
-        owner: str,
-        stars: str,
-        loader: RepositoryLoader,
-        splitter: CodeSplitter,
-        store: CodeVectorStore,
-    ):
+    async def _fetch_and_split(
+        self, repo: _Repository, splitter: CodeSplitter, client: httpx.AsyncClient
+    ) -> tuple[str, list[Document]]:
+        """Load and split one repository, returning its summary line and chunks."""
+        full_name = repo["full_name"]
+        owner = full_name.split("/", 1)[0]
+        stars = repo["stargazers_count"]
+        # RepositoryLoader keeps the repository it loads as state, so each
+        # concurrent load gets its own instance.
+        loader = RepositoryLoader()
         try:
+            # Opening the store does not load the embedding model, so this
+            # check is cheap next to downloading and embedding the repository.
+            store = await asyncio.to_thread(get_vector_store)
+            if store.has_repository(full_name):
+                return f"  = {full_name} — already indexed, skipped", []
             loader.load_repository(repository_name=full_name, creator=owner)
-            docs = loader.get_repository_documents()
-            chunks = splitter.split(docs)
-            store.add_documents(chunks)
-            return (
-                f"  + {full_name} ({stars:,} stars) — {len(docs)} files,"
-                + "{len(chunks)} chunks"
+            docs = await loader.aget_repository_documents(client)
+            for doc in docs:
+                doc.metadata["source_repo"] = full_name
+            chunks = await asyncio.to_thread(splitter.split, docs)
+            summary = (
+                f"  + {full_name} ({stars:,} stars) — {len(docs)} files, "
+                f"{len(chunks)} chunks"
             )
+            return summary, chunks
         except Exception as exc:
-            return f"  - {full_name} — failed: {exc}"
+            return f"  - {full_name} — failed: {exc}", []
@@ -0,0 +1,44 @@
+import atexit
+
+import httpx
+
+from config.config import config
+
+GITHUB_API_URL = "https://api.github.com"
+
+
+def _github_headers() -> dict[str, str]:
+    headers = {
+        "Accept": "application/vnd.github+json",
+        "X-GitHub-Api-Version": "2022-11-28",
+    }
+    if token := config.environment.GITHUB_ACCESS_TOKEN:
+        headers["Authorization"] = f"Bearer {token}"
+    return headers
+
+
+_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+
+# One pooled client for the whole session, so repeated GitHub calls reuse open
+# TLS connections instead of handshaking on every request.
+GITHUB_CLIENT = httpx.Client(
+    base_url=GITHUB_API_URL, headers=_github_headers(), limits=_LIMITS, timeout=30.0
+)
+atexit.register(GITHUB_CLIENT.close)
+
+
+def github_async_client() -> httpx.AsyncClient:
+    """Return a new async GitHub client configured like `GITHUB_CLIENT`.
+
+    An AsyncClient is tied to the event loop it is used on, so rather than one
+    global instance, callers open one per batch of work and share it across
+    that batch's requests.
+    """
+    return httpx.AsyncClient(
+        base_url=GITHUB_API_URL,
+        headers=_github_headers(),
+        limits=_LIMITS,
+        timeout=30.0,
+        # The tarball endpoint answers with a redirect to codeload.github.com.
+        follow_redirects=True,
+    )
@@ -0,0 +1,47 @@
+import io
+import os
+import signal
+import sys
+from contextlib import redirect_stderr, redirect_stdout
+
+import pytest
+
+
+def ignore_sigint() -> None:
+    """Leave Ctrl-C to the parent, which stops a running test by killing us."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def run_pytest(path: str) -> tuple[int, str]:
+    """Run pytest on *path* inside this process and return (exit code, output).
+
+    Meant for a long-lived worker process: pytest and its plugins are imported
+    once, instead of starting a new interpreter on every call.
+    """
+    test_dir = os.path.dirname(path)
+    output = io.StringIO()
+    modules_before = set(sys.modules)
+    try:
+        with redirect_stdout(output), redirect_stderr(output):
+            exit_code = pytest.main(
+                [
+                    path,
+                    "-v",
+                    "--tb=short",
+                    "-p",
+                    "no:cacheprovider",
+                    # Import the test module without touching sys.path.
+                    "--import-mode=importlib",
+                    # Plugins are already imported in this process, so pytest
+                    # cannot rewrite their asserts; that is fine.
+                    "-W",
+                    "ignore::pytest.PytestAssertRewriteWarning",
+                ]
+            )
+    finally:
+        # Forget the test module so the next run starts clean.
+        for name in set(sys.modules) - modules_before:
+            module_file = getattr(sys.modules[name], "__file__", None) or ""
+            if os.path.dirname(module_file) == test_dir:
+                del sys.modules[name]
+    return int(exit_code), output.getvalue()
@@ -1,11 +1,23 @@
-import json
+from typing import Any
 
 
 class RuffParser:
-    def extract_violations(self, lint_output: str) -> list[str]:
-        violations = json.loads(lint_output or "[]")
-        return [
-            f"{v['location']['row']}:{v['location']['column']} "
-            f"{v['code']}: {v['message']}"
-            for v in violations
-        ]
+    def extract_violations(self, diagnostics: list[dict[str, Any]]) -> list[str]:
+        violations: list[str] = []
+        # The server groups diagnostics by rule; `ruff check` lists them by
+        # position in the file.
+        for d in sorted(
+            diagnostics,
+            key=lambda d: (
+                d["range"]["start"]["line"],
+                d["range"]["start"]["character"],
+            ),
+        ):
+            # LSP positions are zero-based and messages carry a trailing "help:"
+            # paragraph; report them the way `ruff check` prints them.
+            start = d["range"]["start"]
+            message = d["message"].partition("\n")[0]
+            violations.append(
+                f"{start['line'] + 1}:{start['character'] + 1} {d['code']}: {message}"
+            )
+        return violations
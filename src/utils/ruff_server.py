@@ -0,0 +1,206 @@
+import atexit
+import io
+import os
+import subprocess
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, cast
+
+import orjson
+
+
+class RuffServer:
+    """
+    Minimal LSP client for a long-lived `ruff server` process.
+
+    Linting and formatting both go through the same warm process, so ruff's
+    start-up and settings discovery are paid once per session instead of once
+    per tool call.  Settings are resolved from the current working directory,
+    just like `ruff check --stdin-filename code.py` would.
+    """
+
+    def __init__(self) -> None:
+        cwd = Path.cwd()
+        self._uri = (cwd / "code.py").as_uri()
+        self._proc = subprocess.Popen(
+            ["ruff", "server"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._lock = threading.Lock()
+        self._next_id = 0
+        # Responses are read into this buffer and parsed in place, so reading
+        # a message does not allocate; it only grows for an unusually large one.
+        self._buffer = bytearray(64 * 1024)
+        self._request(
+            "initialize",
+            {
+                "processId": os.getpid(),
+                "rootUri": cwd.as_uri(),
+                "capabilities": {
+                    # UTF-32 positions are code-point offsets, i.e. str indices.
+                    "general": {"positionEncodings": ["utf-32"]},
+                    "textDocument": {"diagnostic": {}},
+                },
+            },
+        )
+        self._notify("initialized", {})
+        # A single document stays open for the server's lifetime; each call
+        # replaces its text via didChange instead of opening a new one.
+        self._version = 1
+        self._notify(
+            "textDocument/didOpen",
+            {
+                "textDocument": {
+                    "uri": self._uri,
+                    "languageId": "python",
+                    "version": self._version,
+                    "text": "",
+                }
+            },
+        )
+
+    @property
+    def alive(self) -> bool:
+        return self._proc.poll() is None
+
+    def check(self, code: str) -> list[dict[str, Any]]:
+        """Return the LSP diagnostics ruff reports for *code*."""
+        with self._document(code):
+            report = self._request(
+                "textDocument/diagnostic", {"textDocument": {"uri": self._uri}}
+            )
+        return cast(list[dict[str, Any]], report["items"])
+
+    def format(self, code: str) -> str:
+        """Return *code* formatted by ruff, or unchanged if it does not parse."""
+        with self._document(code):
+            edits = self._request(
+                "textDocument/formatting",
+                {
+                    "textDocument": {"uri": self._uri},
+                    "options": {"tabSize": 4, "insertSpaces": True},
+                },
+            )
+        return _apply_edits(code, edits or [])
+
+    def close(self) -> None:
+        """Shut the server down cleanly, killing it if it does not comply."""
+        with self._lock:
+            if not self.alive:
+                return
+            try:
+                self._request("shutdown", None)
+                self._notify("exit", None)
+                self._proc.wait(timeout=2)
+            except (OSError, RuntimeError, subprocess.TimeoutExpired):
+                self._proc.kill()
+                self._proc.wait()
+
+    @contextmanager
+    def _document(self, code: str) -> Iterator[None]:
+        with self._lock:
+            self._version += 1
+            self._notify(
+                "textDocument/didChange",
+                {
+                    "textDocument": {"uri": self._uri, "version": self._version},
+                    "contentChanges": [{"text": code}],
+                },
+            )
+            yield
+
+    def _request(self, method: str, params: Any) -> Any:
+        self._next_id += 1
+        request_id = self._next_id
+        self._send({"id": request_id, "method": method, "params": params})
+        while True:
+            message = self._receive()
+            if "method" not in message:
+                if message.get("id") != request_id:
+                    continue
+                if "error" in message:
+                    raise RuntimeError(
+                        f"ruff server {method} failed: {message['error']['message']}"
+                    )
+                return message.get("result")
+            # Server-to-client requests must be answered or ruff will wait.
+            if "id" in message:
+                self._send({"id": message["id"], "result": None})
+
+    def _notify(self, method: str, params: Any) -> None:
+        self._send({"method": method, "params": params})
+
+    def _send(self, message: dict[str, Any]) -> None:
+        body = orjson.dumps({"jsonrpc": "2.0", **message})
+        stdin = self._proc.stdin
+        assert stdin is not None
+        # stdin is buffered, so writing the header and body separately still
+        # goes out in one flush without concatenating them into a new bytes.
+        stdin.write(b"Content-Length: %d\r\n\r\n" % len(body))
+        stdin.write(body)
+        stdin.flush()
+
+    def _receive(self) -> dict[str, Any]:
+        # Popen's default buffering makes stdout a BufferedReader.
+        stdout = cast(io.BufferedReader, self._proc.stdout)
+        length = 0
+        while header := stdout.readline().strip():
+            name, _, value = header.partition(b":")
+            if name.lower() == b"content-length":
+                length = int(value)
+        if not length:
+            raise RuntimeError("ruff server exited unexpectedly")
+        if length > len(self._buffer):
+            self._buffer = bytearray(length)
+        body = memoryview(self._buffer)[:length]
+        received = 0
+        while received < length:
+            count = stdout.readinto(body[received:])
+            if not count:
+                raise RuntimeError("ruff server exited unexpectedly")
+            received += count
+        return cast(dict[str, Any], orjson.loads(body))
+
+
+def _apply_edits(text: str, edits: list[dict[str, Any]]) -> str:
+    """Apply LSP TextEdits (UTF-32 positions) to *text*."""
+    line_starts = [0]
+    newline = text.find("\n")
+    while newline != -1:
+        line_starts.append(newline + 1)
+        newline = text.find("\n", newline + 1)
+
+    def offset(position: dict[str, int]) -> int:
+        if position["line"] >= len(line_starts):
+            return len(text)
+        return line_starts[position["line"]] + position["character"]
+
+    # Apply back to front so earlier offsets stay valid.
+    spans = sorted(
+        (
+            (offset(e["range"]["start"]), offset(e["range"]["end"]), e["newText"])
+            for e in edits
+        ),
+        reverse=True,
+    )
+    for start, end, new_text in spans:
+        text = text[:start] + new_text + text[end:]
+    return text
+
+
+_server: RuffServer | None = None
+_server_lock = threading.Lock()
+
+
+def get_ruff_server() -> RuffServer:
+    """Return the shared RuffServer, (re)starting it if it is not running."""
+    global _server
+    with _server_lock:
+        if _server is None or not _server.alive:
+            _server = RuffServer()
+            atexit.register(_server.close)
+        return _server
@@ -1,11 +1,25 @@
-# Lazy singleton — HuggingFace model is loaded only when the vector store is first used.
+import threading
+from functools import lru_cache
+from typing import TYPE_CHECKING
 
+if TYPE_CHECKING:
+    from rag.vector_store import CodeVectorStore
 
-def get_vector_store():
+_lock = threading.Lock()
+
+
+def get_vector_store() -> "CodeVectorStore":
     """Return the shared CodeVectorStore singleton, creating it on first call."""
-    global vector_store
-    if vector_store is None:
-        from rag.vector_store import CodeVectorStore
+    # lru_cache alone lets two threads that miss at the same time both build a
+    # store (and load the model twice); the lock makes the second one wait.
+    with _lock:
+        return _create_vector_store()
+
+
+# Lazy singleton — the store is opened on first use, and the HuggingFace model is
+# loaded only when something is first embedded.
+@lru_cache(maxsize=1)
+def _create_vector_store() -> "CodeVectorStore":
+    from rag.vector_store import CodeVectorStore
 
-        vector_store = CodeVectorStore()
-    return vector_store
+    return CodeVectorStore()